@@ -0,0 +1,35 @@
+from typing import Any, Mapping
+
+def _get(obj: Any, key: str, default: Any = None) -> Any:
+    # Accept both plain dicts and objects (e.g. AnalysisResult / RiskFactor)
+    if isinstance(obj, Mapping):
+        return obj.get(key, default)
+    return getattr(obj, key, default)
+
+def format_report_for_telegram(d: Any) -> str:
+    t = (_get(d, "token") or {})
+    name  = t.get("name") or "?"
+    sym   = t.get("symbol") or "?"
+    addr  = t.get("address") or _get(d, "address") or "?"
+    title = f"{sym} ({name})" if name != "?" or sym != "?" else (addr[:6] + "…" + addr[-4:] if addr.startswith("0x") and len(addr) > 10 else addr)
+
+    band = (_get(d, "band") or "").lower()
+    band_badge = {"safe":"🟢 safe","caution":"🟠 caution","high":"🔴 high"}.get(band,"⚪ unknown")
+    score = _get(d, "score")
+    score_txt = f"{score:.1f}" if isinstance(score,(int,float)) else "?"
+
+    def em(sig: float) -> str:
+        return "🔴" if sig <= -0.5 else ("🟢" if sig >= 0.5 else "⚪")
+
+    lines = []
+    for f in (_get(d, "factors") or [])[:8]:
+        label = (_get(f, "label") or (_get(f, "id") or "").replace("_"," ").capitalize() or "Unknown")
+        reason = (_get(f, "evidence") or [""])[0]
+        lines.append(f"{em(_get(f, 'signal', 0))} {label} — {reason}")
+
+    verdict = _get(d, "verdict") or ""
+    return (
+        f"{title}\n{verdict}\n\n"
+        f"Score: {score_txt}  •  Band: {band_badge}\n\n"
+        "Key factors:\n" + "\n".join(lines)
+    )
@@ -1,10 +1,30 @@
-from fastapi import FastAPI, HTTPException, Query
+import asyncio
+from contextlib import asynccontextmanager
+import orjson
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from app.schemas import AnalyzeRequest
+from app.services import http_client
 from app.services.bsc import analyze_bsc, fetch_abi_from_bscscan
+from app.telegram import register_webhook, router as telegram_router
 import os
 
-app = FastAPI(title="MCA — BSC Analyzer", version="0.2")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    http_client.ensure_open()
+    # Fire-and-forget: a slow Telegram API must not hold up startup
+    webhook_task = asyncio.create_task(register_webhook())
+    yield
+    webhook_task.cancel()
+    await http_client.aclose()
+
+app = FastAPI(
+    title="MCA — BSC Analyzer",
+    version="0.2",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -14,20 +34,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.include_router(telegram_router)
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
-@app.post("/analyze")
-def analyze(req: AnalyzeRequest):
-    if req.chain.lower() != "bsc":
+# The body is two strings, so it is checked by hand instead of through a
+# Pydantic model; AnalyzeRequest is kept only to document it in OpenAPI.
+@app.post(
+    "/analyze",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": AnalyzeRequest.model_json_schema()}},
+        }
+    },
+)
+async def analyze(request: Request):
+    try:
+        body = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    if not isinstance(body, dict):
+        body = {}
+    chain, address = body.get("chain"), body.get("address")
+    if not isinstance(chain, str) or not isinstance(address, str) or not address:
+        raise HTTPException(status_code=400, detail="'chain' and 'address' must be strings")
+    if chain.lower() != "bsc":
         raise HTTPException(status_code=400, detail="MVP supports only 'bsc' chain")
-    return analyze_bsc(req).model_dump()
+    result = await analyze_bsc(address)
+    # Return the response directly so FastAPI skips jsonable_encoder
+    return ORJSONResponse(result.model_dump())
 
 @app.get("/debug/bscscan")
-def debug_bscscan(address: str = Query(..., description="Token contract address")):
+async def debug_bscscan(address: str = Query(..., description="Token contract address")):
     key_present = bool(os.getenv("BSCSCAN_API_KEY"))
-    abi = fetch_abi_from_bscscan(address)
+    abi = await fetch_abi_from_bscscan(address)
     return {
         "key_present": key_present,
         "abi_status": "ok" if abi else "missing_or_rate_limited",
@@ -1,14 +1,50 @@
+import asyncio
 import os
-import requests
 from dataclasses import dataclass, asdict
 from typing import List, Dict, Any, Optional
 
+import orjson
+from cachetools import TTLCache
+from eth_abi import decode, encode
+
+from app.services import http_client
+
 # ============================================================
 # CONFIG
 # ============================================================
 
 BSCSCAN_API_KEY = os.getenv("BSCSCAN_API_KEY", "")
 BSC_RPC_URL = os.getenv("BSC_RPC_URL", "https://bsc-dataseed.binance.org/")
+BSCSCAN_API_URL = "https://api.bscscan.com/api"
+
+# BscScan free tier allows 5 req/s: cap in-flight calls and space request
+# starts so bursts don't trip the limiter. The pacer is per process, so the
+# 200 ms interval is scaled by the uvicorn worker count to keep the total
+# across workers at 5 req/s.
+BSCSCAN_CONCURRENCY = 4
+BSCSCAN_MIN_INTERVAL = 0.2 * max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+# Semaphore and pacer slot are bound to one event loop, so they are built
+# lazily and rebuilt when a new loop (another lifespan, a reload) shows up.
+_bscscan_loop: Optional[asyncio.AbstractEventLoop] = None
+_bscscan_sem: Optional[asyncio.Semaphore] = None
+_bscscan_next_slot = 0.0
+
+# Multicall3 (same address on every EVM chain) and the 4-byte selectors we use
+MULTICALL3 = "0xcA11bde05977b3631167028862bE2a173976CA11"
+_SEL_AGGREGATE3 = bytes.fromhex("82ad56cb")  # aggregate3((address,bool,bytes)[])
+_SEL_NAME = bytes.fromhex("06fdde03")        # name()
+_SEL_SYMBOL = bytes.fromhex("95d89b41")      # symbol()
+
+# Successful getabi lookups, keyed by lowercased address (5 min TTL)
+_ABI_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=300)
+
+# Successful tokeninfo (name, symbol) lookups, keyed by lowercased address (1 h TTL)
+_META_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=3600)
+
+# Finished analyses with resolved name/symbol, keyed by lowercased address
+# (5 min TTL). Results are shared between callers and must be treated as
+# read-only.
+_RESULT_CACHE: TTLCache = TTLCache(maxsize=50_000, ttl=300)
 
 # ============================================================
 # DATA MODELS
@@ -58,29 +94,39 @@ class AnalysisResult:
 # MOCK FACTORS (temporary)
 # ============================================================
 
+# (id, weight, signal, evidence) — static until real signals land
+_MOCK_ROWS = (
+    ("ownership",            0.25,  0,  ("Owner unknown (ABI/owner() not available)",)),
+    ("mint_blacklist",       0.20,  0,  ("ABI unavailable",)),
+    ("liquidity_lock",       0.20, -1,  ("LP locked 0.0% via Burned LP",)),
+    ("holder_concentration", 0.15, -1,  ("Top10 holders unknown (API limit)",)),
+    ("dev_history",          0.10,  1,  ("No known rugs linked",)),
+    ("tax_honeypot",         0.05,  0,  ("ABI unavailable",)),
+    ("market_integrity",     0.05,  1,  ("Pancake v2 pair found: 0x0eD7e52944161450477ee417DE9Cd3a859b14fD0",)),
+)
+
 def mock_factors(addr: str) -> List[RiskFactor]:
-    base = [
-        ("ownership",            0.25,  0,  ["Owner unknown (ABI/owner() not available)"]),
-        ("mint_blacklist",       0.20,  0,  ["ABI unavailable"]),
-        ("liquidity_lock",       0.20, -1,  ["LP locked 0.0% via Burned LP"]),
-        ("holder_concentration", 0.15, -1,  ["Top10 holders unknown (API limit)"]),
-        ("dev_history",          0.10,  1,  ["No known rugs linked"]),
-        ("tax_honeypot",         0.05,  0,  ["ABI unavailable"]),
-        ("market_integrity",     0.05,  1,  ["Pancake v2 pair found: 0x0eD7e52944161450477ee417DE9Cd3a859b14fD0"]),
+    # Fresh evidence lists per call so callers can't mutate the shared table
+    return [
+        RiskFactor(id=fid, weight=weight, signal=signal, evidence=list(evidence),
+                   impact=round(weight * signal * 10, 2))  # e.g., 0.2 * (-1*10) = -2.0
+        for fid, weight, signal, evidence in _MOCK_ROWS
     ]
-    factors: List[RiskFactor] = []
-    for fid, weight, signal, evidence in base:
-        impact = round(weight * (signal * 10), 2)  # e.g., 0.2 * (-1*10) = -2.0
-        factors.append(RiskFactor(id=fid, weight=weight, signal=signal, evidence=evidence, impact=impact))
-    return factors
 
 # ============================================================
 # MAIN ANALYZER (mock scoring now, real data later)
 # ============================================================
 
-def analyze_bsc(addr: str) -> AnalysisResult:
-    # 1) Try to fetch token name/symbol from BscScan
-    token_name, token_symbol = fetch_token_meta(addr)
+async def analyze_bsc(addr: str) -> AnalysisResult:
+    # Addresses are handled (and cached) in lowercase so checksummed and
+    # lowercase forms of the same CA share one entry.
+    addr = addr.lower()
+    cached = _RESULT_CACHE.get(addr)
+    if cached is not None:
+        return cached
+
+    # 1) Try to fetch token name/symbol (on-chain, then BscScan)
+    token_name, token_symbol = await fetch_token_meta(addr)
 
     # 2) Compute factors and score (mock for now)
     factors = mock_factors(addr)
@@ -104,7 +150,7 @@ def analyze_bsc(addr: str) -> AnalysisResult:
         "symbol": token_symbol or "?",
     }
 
-    return AnalysisResult(
+    result = AnalysisResult(
         chain="bsc",
         address=addr,
         token=token,
@@ -113,19 +159,53 @@ def analyze_bsc(addr: str) -> AnalysisResult:
         verdict=verdict,
         factors=factors,
     )
+    # Only cache once metadata resolved; a "?" result (RPC/BscScan failure)
+    # must not outlive the outage
+    if token_name or token_symbol:
+        _RESULT_CACHE[addr] = result
+    return result
 
 # ============================================================
 # LIVE LOOKUP HELPERS (optional)
 # ============================================================
 
-def fetch_abi_from_bscscan(address: str) -> Optional[str]:
+def _bscscan_semaphore() -> asyncio.Semaphore:
+    global _bscscan_loop, _bscscan_sem, _bscscan_next_slot
+    loop = asyncio.get_running_loop()
+    if loop is not _bscscan_loop:
+        _bscscan_loop = loop
+        _bscscan_sem = asyncio.Semaphore(BSCSCAN_CONCURRENCY)
+        _bscscan_next_slot = 0.0  # slots are on the old loop's clock
+    return _bscscan_sem
+
+async def _bscscan_pace() -> None:
+    # Reserve the next free start slot, then sleep until it arrives
+    global _bscscan_next_slot
+    now = asyncio.get_running_loop().time()
+    slot = max(now, _bscscan_next_slot)
+    _bscscan_next_slot = slot + BSCSCAN_MIN_INTERVAL
+    if slot > now:
+        await asyncio.sleep(slot - now)
+
+async def _get_json(params: Dict[str, Any]) -> Dict[str, Any]:
+    async with _bscscan_semaphore():
+        await _bscscan_pace()
+        r = await http_client.client().get(BSCSCAN_API_URL, params=params, timeout=12)
+    return orjson.loads(r.content)
+
+async def fetch_abi_from_bscscan(address: str) -> Optional[str]:
     """
     Return contract ABI as a JSON string from BscScan, or None if unavailable.
     Kept for compatibility with main.py imports.
+    Successful results are cached briefly; failures are not, so a
+    rate-limited response is retried on the next call.
     """
     if not BSCSCAN_API_KEY:
         return None
-    url = "https://api.bscscan.com/api"
+    key = address.lower()
+    cached = _ABI_CACHE.get(key)
+    if cached is not None:
+        return cached
     params = {
         "module": "contract",
         "action": "getabi",
@@ -133,23 +213,59 @@ def fetch_abi_from_bscscan(address: str) -> Optional[str]:
         "apikey": BSCSCAN_API_KEY,
     }
     try:
-        r = requests.get(url, params=params, timeout=12)
-        data = r.json()
+        data = await _get_json(params)
         if data.get("status") == "1":
-            return data.get("result")
+            abi = data.get("result")
+            if abi:
+                _ABI_CACHE[key] = abi
+            return abi
         return None
     except Exception:
         return None
 
-def fetch_token_meta(address: str) -> (Optional[str], Optional[str]):
+async def _eth_call(to: str, data: bytes) -> bytes:
+    payload = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "eth_call",
+        "params": [{"to": to, "data": "0x" + data.hex()}, "latest"],
+    }
+    r = await http_client.client().post(
+        BSC_RPC_URL, content=orjson.dumps(payload),
+        headers={"Content-Type": "application/json"}, timeout=8,
+    )
+    body = orjson.loads(r.content)
+    if body.get("error"):
+        raise RuntimeError(body["error"])
+    return bytes.fromhex(body["result"][2:])
+
+def _decode_erc20_string(ret: bytes) -> Optional[str]:
+    # Standard tokens return `string`; some old ones return `bytes32`
+    try:
+        return decode(["string"], ret)[0] or None
+    except Exception:
+        if len(ret) == 32:
+            return ret.rstrip(b"\0").decode("utf-8", "ignore") or None
+        return None
+
+async def _token_meta_onchain(address: str) -> (Optional[str], Optional[str]):
     """
-    Best-effort token name/symbol via BscScan.
-    Returns (name, symbol) or (None, None) if unavailable.
+    name()/symbol() read from the token contract in one Multicall3
+    aggregate3 eth_call. Works without an API key.
     """
-    if not BSCSCAN_API_KEY:
+    calls = [(address, True, _SEL_NAME), (address, True, _SEL_SYMBOL)]
+    try:
+        ret = await _eth_call(MULTICALL3, _SEL_AGGREGATE3 + encode(["(address,bool,bytes)[]"], [calls]))
+        (ok_name, name_raw), (ok_symbol, symbol_raw) = decode(["(bool,bytes)[]"], ret)[0]
+    except Exception:
         return None, None
+    name = _decode_erc20_string(name_raw) if ok_name else None
+    symbol = _decode_erc20_string(symbol_raw) if ok_symbol else None
+    return name, symbol
 
-    url = "https://api.bscscan.com/api"
+async def _token_meta_bscscan(address: str) -> (Optional[str], Optional[str]):
+    if not BSCSCAN_API_KEY:
+        return None, None
     params = {
         "module": "token",
         "action": "tokeninfo",
@@ -157,26 +273,40 @@ def fetch_token_meta(address: str) -> (Optional[str], Optional[str]):
         "apikey": BSCSCAN_API_KEY,
     }
     try:
-        r = requests.get(url, params=params, timeout=12)
-        data = r.json()
-        if data.get("status") == "1":
-            result = data.get("result") or []
-            if isinstance(result, list) and result:
-                item = result[0]
-                name = item.get("tokenName") or item.get("name")
-                symbol = item.get("symbol")
-                return name, symbol
-        return None, None
+        data = await _get_json(params)
+        if data["status"] != "1":
+            return None, None
+        # Only two fields are needed; a missing symbol lands in the except
+        item = data["result"][0]
+        return item.get("tokenName") or item.get("name"), item["symbol"] or None
     except Exception:
         return None, None
 
-def get_token_info_from_bscscan(address: str) -> Dict[str, Any]:
+async def fetch_token_meta(address: str) -> (Optional[str], Optional[str]):
+    """
+    Best-effort token name/symbol: read on-chain first, falling back to
+    BscScan tokeninfo (premium on many tiers).
+    Returns (name, symbol) or (None, None) if unavailable.
+    Successful lookups are cached for an hour; name/symbol rarely change.
+    """
+    key = address.lower()
+    cached = _META_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    name, symbol = await _token_meta_onchain(address)
+    if not (name or symbol):
+        name, symbol = await _token_meta_bscscan(address)
+    if name or symbol:
+        _META_CACHE[key] = (name, symbol)
+    return name, symbol
+
+async def get_token_info_from_bscscan(address: str) -> Dict[str, Any]:
     """
     Raw tokeninfo call (not used by analyzer, useful for debugging).
     """
     if not BSCSCAN_API_KEY:
         return {"error": "Missing BSCSCAN_API_KEY"}
-    url = "https://api.bscscan.com/api"
     params = {
         "module": "token",
         "action": "tokeninfo",
@@ -184,7 +314,6 @@ def get_token_info_from_bscscan(address: str) -> Dict[str, Any]:
         "apikey": BSCSCAN_API_KEY,
     }
     try:
-        r = requests.get(url, params=params, timeout=12)
-        return r.json()
+        return await _get_json(params)
     except Exception as e:
         return {"error": str(e)}
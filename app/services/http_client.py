@@ -0,0 +1,37 @@
+from typing import Optional
+
+import httpx
+
+# One pooled async client shared by BscScan lookups and Telegram replies,
+# so TCP/TLS connections are reused across requests. Opened on app startup
+# and closed on shutdown; always go through client() so a reopened
+# instance is picked up.
+_client: Optional[httpx.AsyncClient] = None
+
+def _build() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=15,
+        headers={"User-Agent": "mca/0.2"},
+        # retries=2 re-attempts failed connects (not HTTP error statuses)
+        transport=httpx.AsyncHTTPTransport(
+            retries=2,
+            limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+        ),
+    )
+
+def ensure_open() -> None:
+    """Create the shared client (no-op if one is already open)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build()
+
+def client() -> httpx.AsyncClient:
+    # Lazily opens outside the app lifespan (scripts, ad-hoc calls)
+    ensure_open()
+    return _client
+
+async def aclose() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,32 +1,125 @@
-# app/bot/telegram.py
+# app/telegram.py
+import asyncio
+import hmac
+import logging
 import os
-import re
-import requests
-from fastapi import APIRouter, HTTPException, Request
+import time
+from collections import OrderedDict
+
+import orjson
+from cachetools import TTLCache
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
 
 from app.bot_formatting import format_report_for_telegram
 from app.services.bsc import analyze_bsc  # call analyzer directly, faster & simpler
+from app.services import http_client
 
 router = APIRouter()
+log = logging.getLogger(__name__)
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "").strip()
-TG_API = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage" if TELEGRAM_BOT_TOKEN else None
+TG_BASE = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}" if TELEGRAM_BOT_TOKEN else None
+TG_API = f"{TG_BASE}/sendMessage" if TG_BASE else None
+# Public URL of this app's /tg route; when set, the webhook is registered on startup
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "").strip()
+# Must match the secret_token given to setWebhook; empty disables the check
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "").strip()
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+_HEX_CHARS = frozenset("0123456789abcdefABCDEF")
 
-# Simple CA matcher
-CA_RE = re.compile(r"^0x[a-fA-F0-9]{40}$")
+def is_ca(s: str) -> bool:
+    """Cheap CA check: "0x" followed by exactly 40 hex chars."""
+    return len(s) == 42 and s[:2] == "0x" and _HEX_CHARS.issuperset(s[2:])
 
 HELP_TEXT = (
     "Hi! Send me a BSC contract address (CA), like:\n"
     "`0x0E09FABB73BD3ADE0A17ECC321FD13A19E81CE82`\n\n"
     "I’ll analyze it and reply with a score, risk band, and key factors."
 )
+INVALID_CA_TEXT = "Please send a valid BSC contract address (starts with 0x + 40 hex chars)."
+ERROR_TEXT = "❌ Sorry, couldn’t analyze. Try again in a minute."
+
+def _template(text: str) -> bytes:
+    # Pre-encoded sendMessage body with a %d slot for chat_id
+    return b'{"chat_id":%d,"text":' + orjson.dumps(text).replace(b"%", b"%%") + b"}"
+
+HELP_BODY = _template(HELP_TEXT)
+INVALID_CA_BODY = _template(INVALID_CA_TEXT)
+ERROR_BODY = _template(ERROR_TEXT)
+
+# Per-chat token bucket: 1 message/sec sustained, bursts of 5. Idle chats
+# are evicted LRU-style so the table stays bounded.
+RATE_PER_SEC = 1.0
+RATE_BURST = 5.0
+_BUCKETS_MAX = 50_000
+_buckets: "OrderedDict[int, tuple[float, float]]" = OrderedDict()  # chat_id -> (tokens, last_ts)
+
+def _allow(chat_id: int) -> bool:
+    now = time.monotonic()
+    tokens, last = _buckets.pop(chat_id, (RATE_BURST, now))
+    tokens = min(RATE_BURST, tokens + (now - last) * RATE_PER_SEC)
+    allowed = tokens >= 1
+    _buckets[chat_id] = (tokens - 1 if allowed else tokens, now)
+    if len(_buckets) > _BUCKETS_MAX:
+        _buckets.popitem(last=False)
+    return allowed
 
-def _send(chat_id: int, text: str) -> None:
+async def _post(body: bytes) -> None:
     if not TELEGRAM_BOT_TOKEN or not TG_API:
         # Fail loudly so you notice misconfig fast
         raise RuntimeError("Missing TELEGRAM_BOT_TOKEN env var.")
+    await http_client.client().post(TG_API, content=body, headers=JSON_HEADERS)
+
+async def _send(chat_id: int, text: str) -> None:
     # Telegram expects plain text; we’re not using Markdown here to avoid escaping complexity
-    requests.post(TG_API, json={"chat_id": chat_id, "text": text}, timeout=15)
+    await _post(orjson.dumps({"chat_id": chat_id, "text": text}))
+
+async def _send_raw(chat_id: int, template: bytes) -> None:
+    """Send one of the pre-encoded constant replies (see _template)."""
+    await _post(template % chat_id)
+
+WEBHOOK_MAX_CONNECTIONS = 100
+WEBHOOK_ALLOWED_UPDATES = ["message", "edited_message"]
+
+async def register_webhook() -> None:
+    """
+    Point Telegram at TELEGRAM_WEBHOOK_URL with a higher fan-out and only the
+    update types we handle. No-op when the URL or bot token is unset; errors
+    are logged so a Telegram hiccup never breaks startup.
+
+    Every worker runs this, so it first checks getWebhookInfo and only calls
+    setWebhook (which drops pending updates) when the registration actually
+    differs. getWebhookInfo doesn't expose the secret, so a secret-only change
+    needs a URL/fan-out change (or a manual setWebhook) to take effect.
+    """
+    if not TG_BASE or not TELEGRAM_WEBHOOK_URL:
+        return
+    client = http_client.client()
+    try:
+        r = await client.get(f"{TG_BASE}/getWebhookInfo")
+        info = orjson.loads(r.content).get("result") or {}
+        if (
+            info.get("url") == TELEGRAM_WEBHOOK_URL
+            and info.get("max_connections") == WEBHOOK_MAX_CONNECTIONS
+            and sorted(info.get("allowed_updates") or []) == sorted(WEBHOOK_ALLOWED_UPDATES)
+        ):
+            return
+
+        payload = {
+            "url": TELEGRAM_WEBHOOK_URL,
+            "max_connections": WEBHOOK_MAX_CONNECTIONS,
+            "allowed_updates": WEBHOOK_ALLOWED_UPDATES,
+            "drop_pending_updates": True,
+        }
+        if TELEGRAM_WEBHOOK_SECRET:
+            payload["secret_token"] = TELEGRAM_WEBHOOK_SECRET
+        r = await client.post(f"{TG_BASE}/setWebhook", content=orjson.dumps(payload), headers=JSON_HEADERS)
+        if not orjson.loads(r.content).get("ok"):
+            # e.g. 429 when several workers start within Telegram's 1/sec limit
+            log.warning("setWebhook rejected: %s", r.text)
+    except Exception:
+        log.exception("Webhook registration failed")
 
 def _extract_chat_and_text(update: dict) -> tuple[int, str]:
     """
@@ -37,19 +130,77 @@ def _extract_chat_and_text(update: dict) -> tuple[int, str]:
         raise ValueError("No message in update")
     chat_id = msg.get("chat", {}).get("id")
     text = (msg.get("text") or "").strip()
-    if chat_id is None:
+    # Must be a real int: the pre-encoded reply templates format it with %d
+    if not isinstance(chat_id, int) or isinstance(chat_id, bool):
         raise ValueError("No chat_id")
     return chat_id, text
 
+# Rendered replies by address; same TTL as the analyzer's result cache, so
+# a repeat CA is one dict lookup plus the sendMessage call.
+_REPLY_CACHE: TTLCache = TTLCache(maxsize=50_000, ttl=300)
+
+# In-flight renders by address: concurrent requests for the same CA share
+# one analyze_bsc call instead of each hitting BscScan.
+_inflight: dict[str, asyncio.Task] = {}
+
+async def _render(address: str) -> str:
+    result = await analyze_bsc(address)         # dataclass result
+    reply = format_report_for_telegram(result)  # pretty string
+    # Same rule as the analyzer's cache: never keep a "?"-titled report
+    if result.token.get("name") != "?" or result.token.get("symbol") != "?":
+        _REPLY_CACHE[address] = reply
+    return reply
+
+async def _reply_once(address: str) -> str:
+    reply = _REPLY_CACHE.get(address)
+    if reply is not None:
+        return reply
+    task = _inflight.get(address)
+    if task is None:
+        task = asyncio.ensure_future(_render(address))
+        _inflight[address] = task
+        task.add_done_callback(lambda _: _inflight.pop(address, None))
+    # shield: one waiter being cancelled must not cancel the shared call
+    return await asyncio.shield(task)
+
+async def _analyze_and_reply(chat_id: int, address: str) -> None:
+    """
+    Runs after the webhook has already answered Telegram, so failures
+    can only be logged, not returned.
+    """
+    try:
+        reply = await _reply_once(address)
+    except Exception:
+        log.exception("Analysis failed for %s", address)
+        # Don’t leak stacktraces to users
+        await _send_raw(chat_id, ERROR_BODY)
+        return
+
+    # Send the reply back
+    try:
+        await _send(chat_id, reply)
+    except Exception:
+        # If sending fails, let Render logs show why
+        log.exception("Telegram send failed for chat %s", chat_id)
+
 @router.post("/tg")
-async def telegram_webhook(request: Request):
+async def telegram_webhook(request: Request, background: BackgroundTasks):
     """
     Telegram will POST updates here.
     Make sure your bot's webhook is set to: https://<your-domain>/tg
+    Answers immediately; replies are sent from background tasks so a slow
+    analysis never holds the webhook open.
     """
+    # Reject spoofed POSTs before reading the body
+    if TELEGRAM_WEBHOOK_SECRET and not hmac.compare_digest(
+        request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode(),
+        TELEGRAM_WEBHOOK_SECRET.encode(),
+    ):
+        raise HTTPException(status_code=401, detail="Bad secret token")
+
     try:
-        update = await request.json()
-    except Exception:
+        update = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON")
 
     try:
@@ -58,33 +209,22 @@ async def telegram_webhook(request: Request):
         # Nothing we can do without chat_id; just 200 to avoid retry storms
         return {"ok": True, "ignored": str(e)}
 
+    # Over the per-chat budget → drop silently (no BscScan call, no reply)
+    if not _allow(chat_id):
+        return {"ok": True, "throttled": True}
+
     # /start or empty → help
-    if not text or text.lower().startswith("/start"):
-        _send(chat_id, HELP_TEXT)
+    if not text or text[:6].lower() == "/start":  # lowercase the prefix only
+        background.add_task(_send_raw, chat_id, HELP_BODY)
         return {"ok": True}
 
     # Validate contract address
-    candidate = text.split()[0]  # take first token in the message
-    if not CA_RE.match(candidate):
-        _send(chat_id, "Please send a valid BSC contract address (starts with 0x + 40 hex chars).")
+    # First token; a CA is 42 chars, so 43 is enough to tell it apart
+    candidate = text[:43].split(maxsplit=1)[0]
+    if not is_ca(candidate):
+        background.add_task(_send_raw, chat_id, INVALID_CA_BODY)
         return {"ok": True}
 
-    # Analyze (direct call) and format
-    try:
-        result = analyze_bsc(candidate)           # dataclass result
-        data = result.model_dump()                # dict for formatter
-        reply = format_report_for_telegram(data)  # pretty string
-    except Exception as e:
-        # Don’t leak stacktraces to users
-        _send(chat_id, "❌ Sorry, couldn’t analyze. Try again in a minute.")
-        # Return detail for logs
-        return {"ok": False, "error": str(e)}
-
-    # Send the reply back
-    try:
-        _send(chat_id, reply)
-    except Exception as e:
-        # If sending fails, let Render logs show why
-        raise HTTPException(status_code=500, detail=f"Telegram send failed: {e}")
-
+    # Lowercase once: reply cache and in-flight keys are lowercase addresses
+    background.add_task(_analyze_and_reply, chat_id, candidate.lower())
     return {"ok": True}